@@ -1,20 +1,48 @@
 import os
 import re
+import sys
+import time
+import queue
+import types
+import functools
+import threading
+import hmac
+import hashlib
 import logging
+import logging.handlers
+import unicodedata
+import ahocorasick
 import openai
+import orjson
 import requests
+import tiktoken
+from requests.adapters import HTTPAdapter
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from flask import Flask, request, jsonify, make_response
+from pathlib import Path
+from flask import Flask, request, make_response
+from flask.json.provider import DefaultJSONProvider
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
-from slack_sdk.signature import SignatureVerifier
-from difflib import get_close_matches
+from rapidfuzz import fuzz, process as fuzz_process, utils as fuzz_utils
 from dotenv import load_dotenv
 
+try:
+    import redis
+except ImportError:  # optional; in-memory stores remain the dev default
+    redis = None
+
+import semantic_cache
+
 load_dotenv()
 
-# Logging
-logging.basicConfig(level=logging.INFO)
+# Logging: records go through a queue and a listener thread does the actual
+# stream writes, so request/worker threads never block on stdout
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
+_log_listener = logging.handlers.QueueListener(_log_queue, logging.StreamHandler())
+_log_listener.start()
+logging.basicConfig(level=logging.INFO, handlers=[logging.handlers.QueueHandler(_log_queue)])
 logger = logging.getLogger(__name__)
 
 # Env vars
@@ -26,112 +54,441 @@ WIKI_LOOKUP_ENABLED = os.getenv("WIKI_LOOKUP_ENABLED", "true").lower() in ("1",
 if not (OPENAI_API_KEY and SLACK_BOT_TOKEN and SLACK_SIGNING_SECRET):
     logger.warning("One or more required env vars are missing (OPENAI_API_KEY, SLACK_BOT_TOKEN, SLACK_SIGNING_SECRET)")
 
-# OpenAI (v0.28.x pinned)
+# OpenAI (v0.28.x pinned). Give it a pooled keep-alive session so chat and
+# embedding calls reuse connections instead of paying a TLS handshake each.
 openai.api_key = OPENAI_API_KEY
+_openai_session = requests.Session()
+_openai_session.mount("https://", HTTPAdapter(pool_connections=50, pool_maxsize=50))
+openai.requestssession = _openai_session
+
+# Pooled keep-alive session for Wikipedia lookups, same reasoning as above
+_wiki_session = requests.Session()
+_wiki_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+_wiki_session.headers["User-Agent"] = "slack-gpt-bot/1.0"
 
-# Slack client & verifier
+# Slack client & signing secret (encoded once; verification is inlined below)
 client = WebClient(token=SLACK_BOT_TOKEN)
-signature_verifier = SignatureVerifier(SLACK_SIGNING_SECRET)
-
-# Simple custom Q&A
-custom_qa = {
-    "what is the leave policy": "Avertra provides 12 sick and 12 casual leaves annually.",
-    "who do i contact for it issues": "Please email it.support@avertra.com or message #it-helpdesk.",
-    "what is avertra’s vision": "“Simplify Utility Innovation” is Avertra’s long-term vision.",
-    "how do i request an id card re-issue": "Use the ID Card Form from the HR Portal or type `id card` here.",
-    "where can i find the holiday calendar": "Visit SharePoint > HR Documents > Holiday Calendar 2025.",
-    "who is the head of sap department": "The SAP department head is Mr. Khurram Siddique.",
-    "how do i claim medical reimbursement": "Use the form on Intranet > Finance > Claims → Upload bills.",
-    "what is the company dress code": "Smart casuals on weekdays, formals on Mondays.",
-    "how do i get access to sap dev system": "Raise a request at sapaccess@avertra.com with your manager in CC.",
-    "what is the organization structure": "You can view the org chart in HR Portal > Org Chart.",
-    "how to apply for leave": "Please use the following leave request form: https://docs.google.com/forms/d/e/1FAIpQLSd1GZ1Rg_7QxOD19Sgm43-OJtfG6TVBfyLo1REIosTLoH4piQ/viewform",
-    "pto planner link": "Please access the following PTO link to apply for your leave: https://docs.google.com/spreadsheets/d/10ilz4TLd1KzsqzRTp6kvydV96-kZuN6inslLmxnx7p8/edit?gid=61543925#gid=61543925",
-    "byd link": "https://my335994.sapbydesign.com/sap/public/ap/ui/repository/SAP_UI/HTMLOBERON5/client.html?",
-    "who is the payroll vendor for avertra": "Payline India.",
-    "what is the payroll portal link for indian employees in avertra": "URL: https://avertra.paylineindia.com\nLog in with your ESS credentials.",
-    "what is avertra": "Since 2007, Avertra has been driven by one mission: to simplify life. Over the years, we've expanded our reach across many cultures and geographies, ultimately recognizing that people share core needs—from access to trusted digital services to clean water and stable power. Guided by its diverse perspectives and foundational pillars—empathy, science, strategy, and technology—we create experiences that empower communities and connect people to what matters most.",
-    "what is the avertra website link": "https://avertra.com",
-    "can you brief us on a few success stories of avertra": "Yes, please use the URL below to access Avertra's success stories: https://avertra.com/category/success-stories/",
-    "what is the ai initiative program in the sap department": "The AI Initiative program in the SAP department is a strategic effort aimed at exploring and defining artificial intelligence (AI) use cases that can significantly enhance the way we work. This includes identifying opportunities where AI can improve processes, enhance customer experiences, and support smarter decision-making within SAP operations."
+SLACK_SIGNING_SECRET_BYTES = (SLACK_SIGNING_SECRET or "").encode()
+
+_WS_RE = re.compile(r"\s+")
+
+def _normalize_key(text: str) -> str:
+    """Lowercase, drop trailing punctuation and collapse runs of whitespace."""
+    return _WS_RE.sub(" ", text.lower().strip().rstrip("?.! "))
+
+# Simple custom Q&A, kept in qa.json so the data has a single source of
+# truth. Keys are lowercased and NFC-normalized at load so exact lookups and
+# the fuzzy matcher always see canonical forms (the source historically mixed
+# curly and straight apostrophes).
+_QA_PATH = Path(__file__).with_name("qa.json")
+# Keys are interned (short strings compare by pointer on a hit) and the
+# mappings wrapped read-only so worker threads share them without copies.
+custom_qa = types.MappingProxyType({
+    sys.intern(unicodedata.normalize("NFC", k.lower())): v
+    for k, v in orjson.loads(_QA_PATH.read_bytes()).items()
+})
+
+# Precomputed once so the fuzzy matcher doesn't rebuild the choices per event.
+# Keys are preprocessed (lowercased, punctuation stripped) up front so each
+# incoming event only has to process the query string; the match index maps
+# back into QA_KEYS to find the answer.
+QA_KEYS = tuple(custom_qa.keys())
+QA_PROCESSED = tuple(fuzz_utils.default_process(k) for k in QA_KEYS)
+# Normalized-key view so "What is the leave policy?" still hits the O(1) path
+QA_NORMALIZED = types.MappingProxyType({sys.intern(_normalize_key(k)): v for k, v in custom_qa.items()})
+
+# Some entries are really keyword triggers: "what's the byd link?" should hit
+# even though it fuzzy-scores poorly against the short key. An Aho-Corasick
+# automaton finds any trigger phrase in one pass over the message.
+TRIGGER_MAP = {
+    "byd link": custom_qa["byd link"],
+    "pto planner link": custom_qa["pto planner link"],
+    "how to apply for leave": custom_qa["how to apply for leave"],
 }
+trigger_automaton = ahocorasick.Automaton()
+for phrase, answer in TRIGGER_MAP.items():
+    trigger_automaton.add_word(phrase, answer)
+trigger_automaton.make_automaton()
+
+# Static part of the GPT system prompt, joined once at import; only the
+# timestamp and optional wiki context vary per request
+SYS_PROMPT_PREFIX = (
+    "You are a helpful assistant. Always be accurate and prefer saying 'I don't know' if you are not sure.\n"
+    "If you use external facts supplied in the context, cite the source when possible."
+)
+
+# No-op inputs that should never reach the (multi-second, billed) GPT path
+GREETINGS = frozenset({"hi", "hello", "hey", "thanks", "thank you", "ok", "okay", "yes", "no"})
+GREETING_REPLY = "Hi! Ask me a question and I'll do my best to help."
+TOO_SHORT_REPLY = "Could you give me a bit more detail so I can help?"
+
+# State backend. Per-process dicts break under gunicorn -w N > 1 (each worker
+# sees different dedupe/history state), so production deployments should set
+# REDIS_URL; without it the dev-friendly in-memory stores below are used.
+REDIS_URL = os.getenv("REDIS_URL")
+_redis = None
+if REDIS_URL:
+    if redis is None:
+        logger.warning("REDIS_URL is set but the redis package is not installed; using in-memory stores")
+    else:
+        _redis = redis.Redis.from_url(REDIS_URL)
 
-# In-memory stores (dev-friendly). Replace with Redis/DB for production.
-processed_event_ids = set()
-MAX_SEEN = 2000
+# In-memory stores (dev-friendly fallback when REDIS_URL is unset).
+# Recently seen event ids as 64-bit digests, insertion-ordered so eviction
+# drops the oldest; int keys are a third the size of the id strings and
+# hash by value.
+processed_event_ids: OrderedDict[int, None] = OrderedDict()
+MAX_SEEN = 4096
+EVENT_ID_TTL_SECONDS = 60 * 60  # Redis-side retention for seen event_ids
 
 # Conversation history: channel_id -> list of {"role": "user"|"assistant", "content": "..."}
 conversations: dict[str, list[dict]] = {}
 # Session timestamps: channel_id -> last activity epoch
 session_timestamps: dict[str, float] = {}
 MAX_HISTORY = 10                # keep last N messages
+HISTORY_TOKEN_BUDGET = 2000     # cap on history tokens sent to OpenAI
 SESSION_TTL_SECONDS = 60 * 30   # expire sessions after 30 minutes of inactivity
+STREAM_UPDATE_INTERVAL = 0.5    # seconds between Slack edits while streaming
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Back Flask's JSON hooks with orjson, so request.json / jsonify used
+    anywhere (including extensions) skip stdlib json."""
+
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+
+# Compiled once; clean_text runs on every inbound event
+_MENTION_RE = re.compile(r"<@[^>]+>")
+# One scan instead of ten Python-level substring searches per event
+_SEARCH_RE = re.compile(r"\b(?:who|what|where|when|how|define|wiki|latest|news)\b|\?", re.IGNORECASE)
+# Local date/time intents, dispatched on the named group that matched
+_INTENT_RE = re.compile(
+    r"(?P<date>\b(?:today|current)\b.*\bdate\b|\bdate\b.*\b(?:today|current)\b|today['’]?s date)"
+    r"|(?P<time>\b(?:now|current)\b.*\btime\b|\btime\b.*\b(?:now|current)\b)",
+    re.IGNORECASE,
+)
+
+# Workers that run the slow OpenAI/Slack calls after the route has ACKed.
+# Slack retries events not answered within ~3s, so the HTTP response must
+# not wait on the model.
+executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="slack-event")
+
+def verify_slack_signature(raw_body: bytes, headers) -> bool:
+    """Check Slack's v0 request signature over the raw body.
+
+    Inlines what slack_sdk's SignatureVerifier does, but with the secret
+    encoded once at import instead of per request; the HMAC-SHA256 itself
+    runs through OpenSSL's hardware-accelerated path. Stale or unparsable
+    timestamps are rejected before any hashing — Slack signs requests within
+    a 5-minute window, so anything older is a replay or clock problem.
+    """
+    ts = headers.get("X-Slack-Request-Timestamp", "")
+    try:
+        if abs(time.time() - int(ts)) > 60 * 5:
+            return False
+    except ValueError:
+        return False
+    given = headers.get("X-Slack-Signature", "")
+    mac = hmac.new(SLACK_SIGNING_SECRET_BYTES, f"v0:{ts}:".encode() + raw_body, hashlib.sha256)
+    return hmac.compare_digest("v0=" + mac.hexdigest(), given)
 
 def clean_text(text: str) -> str:
     """Remove Slack mentions like <@U12345> and return trimmed text."""
     if not text:
         return ""
-    cleaned = re.sub(r"<@[^>]+>", "", text)
-    return cleaned.strip()
+    return _MENTION_RE.sub("", text).strip()
+
+def match_custom_qa(text: str) -> str | None:
+    """Return a canned answer for text, or None if nothing matches well enough.
+
+    Tries an O(1) exact key hit, then a single-pass trigger scan, and only
+    falls back to fuzzy scoring for long-form questions.
+    """
+    lowered = text.lower()
+    direct = QA_NORMALIZED.get(_normalize_key(text))
+    if direct:
+        return direct
+    for _end, answer in trigger_automaton.iter(lowered):
+        return answer
+    hit = fuzz_process.extractOne(
+        fuzz_utils.default_process(text),
+        QA_PROCESSED,
+        processor=None,
+        scorer=fuzz.token_set_ratio,
+        score_cutoff=65,
+    )
+    if hit:
+        return custom_qa[QA_KEYS[hit[2]]]
+    return None
 
 def looks_like_search_query(text: str) -> bool:
-    t = text.lower()
-    keywords = ["who", "what", "where", "when", "how", "define", "wiki", "latest", "news", "?"]
-    return any(k in t for k in keywords)
+    return bool(_SEARCH_RE.search(text))
 
+@functools.lru_cache(maxsize=512)
 def wiki_summary(query: str, max_chars=800) -> str | None:
+    # Memoized on the normalized query: users repeat the same factual
+    # questions, and a dict hit beats a ~200ms network round trip. Lookups
+    # that found nothing are cached too, which spares known-fruitless calls.
+    # Single MediaWiki round trip: generator=prefixsearch resolves the title
+    # and prop=extracts|info fetches the intro and canonical URL in the same
+    # response, instead of an opensearch call followed by an extracts call.
     try:
         url = "https://en.wikipedia.org/w/api.php"
         params = {
-            "action": "opensearch",
-            "search": query,
-            "limit": 1,
-            "namespace": 0,
-            "format": "json"
+            "action": "query",
+            "generator": "prefixsearch",
+            "gpssearch": query,
+            "gpslimit": 1,
+            "prop": "extracts|info",
+            "exintro": True,
+            "explaintext": True,
+            "inprop": "url",
+            "format": "json",
+            "redirects": True
         }
-        r = requests.get(url, params=params, timeout=5)
+        r = _wiki_session.get(url, params=params, timeout=5)
         r.raise_for_status()
-        data = r.json()
-        if len(data) >= 4 and data[1]:
-            title = data[1][0]
-            page_url = data[3][0] if len(data[3]) > 0 else None
-            summary_params = {
-                "action": "query",
-                "prop": "extracts",
-                "exintro": True,
-                "explaintext": True,
-                "titles": title,
-                "format": "json",
-                "redirects": True
-            }
-            r2 = requests.get(url, params=summary_params, timeout=5)
-            r2.raise_for_status()
-            j = r2.json()
-            pages = j.get("query", {}).get("pages", {})
-            for pid, page in pages.items():
-                extract = page.get("extract", "")
-                if extract:
-                    txt = extract.strip()
-                    if len(txt) > max_chars:
-                        txt = txt[:max_chars].rsplit(" ", 1)[0] + "..."
-                    context = f"Wikipedia summary for '{title}':\n{txt}"
-                    if page_url:
-                        context += f"\nSource: {page_url}"
-                    return context
+        pages = r.json().get("query", {}).get("pages", {})
+        for pid, page in pages.items():
+            extract = page.get("extract", "")
+            if extract:
+                title = page.get("title", query)
+                page_url = page.get("fullurl")
+                txt = extract.strip()
+                if len(txt) > max_chars:
+                    txt = txt[:max_chars].rsplit(" ", 1)[0] + "..."
+                context = f"Wikipedia summary for '{title}':\n{txt}"
+                if page_url:
+                    context += f"\nSource: {page_url}"
+                return context
     except Exception as e:
         logger.debug("Wikipedia lookup failed: %s", e)
     return None
 
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    """gpt-3.5-turbo tokenizer, loaded on first use (may fetch the BPE file)."""
+    return tiktoken.encoding_for_model("gpt-3.5-turbo")
+
+def _token_len(text: str) -> int:
+    try:
+        return len(_encoding().encode(text))
+    except Exception:
+        # tokenizer unavailable (e.g. no network for the BPE download):
+        # estimate at ~4 chars/token rather than failing the event
+        return len(text) // 4 + 1
+
+def seen_event(event_id: str) -> bool:
+    """Record event_id, returning True if it was already seen.
+
+    With Redis this is a single atomic SET NX with TTL, safe across workers;
+    in-memory it falls back to the bounded OrderedDict.
+    """
+    if _redis is not None:
+        return _redis.set(f"evt:{event_id}", 1, nx=True, ex=EVENT_ID_TTL_SECONDS) is None
+    # Store a 64-bit blake2b digest instead of the id string; collisions at
+    # 4096 live entries are vanishingly unlikely (~2^-40)
+    key = int.from_bytes(hashlib.blake2b(event_id.encode(), digest_size=8).digest(), "big")
+    if key in processed_event_ids:
+        return True
+    processed_event_ids[key] = None
+    if len(processed_event_ids) > MAX_SEEN:
+        processed_event_ids.popitem(last=False)
+    return False
+
+def get_history(channel_id: str) -> list[dict]:
+    """Return the conversation history for a channel, oldest first.
+
+    In-memory sessions expire lazily here on access; the periodic sweep below
+    only exists to bound memory for channels that never come back.
+    """
+    if _redis is not None:
+        return [orjson.loads(raw) for raw in _redis.lrange(f"hist:{channel_id}", 0, -1)]
+    ts = session_timestamps.get(channel_id)
+    if ts is not None and time.time() - ts > SESSION_TTL_SECONDS:
+        conversations.pop(channel_id, None)
+        session_timestamps.pop(channel_id, None)
+        return []
+    return list(conversations.get(channel_id, []))
+
+def append_history(channel_id: str, message: dict) -> None:
+    """Append a message to the channel history, trimmed to MAX_HISTORY.
+
+    The Redis list carries SESSION_TTL_SECONDS natively, so inactive sessions
+    expire without any sweeping. Each message is tokenized once here and the
+    count stored alongside it, so later budget trims don't re-encode.
+    """
+    message = {**message, "_tok": _token_len(message["content"])}
+    if _redis is not None:
+        key = f"hist:{channel_id}"
+        pipe = _redis.pipeline()
+        pipe.rpush(key, orjson.dumps(message))
+        pipe.ltrim(key, -MAX_HISTORY, -1)
+        pipe.expire(key, SESSION_TTL_SECONDS)
+        pipe.execute()
+        return
+    hist = conversations.get(channel_id, [])
+    hist.append(message)
+    conversations[channel_id] = hist[-MAX_HISTORY:]
+
 def prune_inactive_sessions():
     """Remove conversations older than SESSION_TTL_SECONDS to keep memory bounded."""
-    now_ts = datetime.now().timestamp()
+    now_ts = time.time()
     to_delete = [ch for ch, ts in session_timestamps.items() if now_ts - ts > SESSION_TTL_SECONDS]
     for ch in to_delete:
         session_timestamps.pop(ch, None)
         conversations.pop(ch, None)
 
+PRUNE_INTERVAL_SECONDS = 60 * 5
+
+def _schedule_prune() -> None:
+    """Sweep expired sessions periodically, off the request path."""
+    prune_inactive_sessions()
+    timer = threading.Timer(PRUNE_INTERVAL_SECONDS, _schedule_prune)
+    timer.daemon = True
+    timer.start()
+
+if _redis is None:
+    _prune_timer = threading.Timer(PRUNE_INTERVAL_SECONDS, _schedule_prune)
+    _prune_timer.daemon = True
+    _prune_timer.start()
+
+def _handle_event(channel_id: str, cleaned_text: str) -> None:
+    """Resolve a message and post the reply. Runs on the executor, so any
+    exception must be logged here — futures swallow them otherwise."""
+    try:
+        # Local handling for date/time questions: one regex pass, branch on
+        # whichever named group matched
+        lc = cleaned_text.lower()
+        intent = _INTENT_RE.search(cleaned_text)
+        if intent and intent.lastgroup == "date":
+            response_text = f"Today's date is {datetime.now().strftime('%B %d, %Y')}."
+        elif intent and intent.lastgroup == "time":
+            response_text = f"The current time is {datetime.now().strftime('%I:%M %p')}."
+        else:
+            # 1) custom Q&A (exact hit, triggers, then fuzzy)
+            qa_answer = match_custom_qa(cleaned_text)
+            if qa_answer:
+                response_text = qa_answer
+            elif lc in GREETINGS:
+                response_text = GREETING_REPLY
+            elif len(cleaned_text.split()) < 2:
+                # Not worth a chat completion round trip
+                response_text = TOO_SHORT_REPLY
+            else:
+                # Streams its reply to Slack itself
+                _answer_with_gpt(channel_id, cleaned_text)
+                return
+
+        _post(channel_id, response_text)
+    except Exception:
+        logger.exception("Unhandled error while handling event for channel %s", channel_id)
+
+def _post(channel_id: str, text: str) -> None:
+    """Send a reply back to Slack."""
+    try:
+        client.chat_postMessage(channel=channel_id, text=text)
+        logger.info("Replied to channel %s", channel_id)
+    except SlackApiError as e:
+        logger.exception("Slack API error sending message: %s", e)
+
+def _answer_with_gpt(channel_id: str, cleaned_text: str) -> None:
+    """Fall back to OpenAI with conversation history and optional wiki context.
+
+    The completion is streamed: a placeholder message goes out immediately and
+    is edited as tokens arrive, so the user sees the answer forming instead of
+    waiting for the full round trip.
+    """
+    # Semantic cache: a near-duplicate of an already-answered question reuses
+    # the cached answer instead of paying for another chat completion.
+    q_vec = semantic_cache.embed(cleaned_text)
+    if q_vec is not None:
+        cached = semantic_cache.lookup(q_vec)
+        if cached:
+            logger.info("Semantic cache hit for channel %s", channel_id)
+            _post(channel_id, cached)
+            return
+
+    # Optional wiki lookup
+    wiki_ctx = None
+    if WIKI_LOOKUP_ENABLED and looks_like_search_query(cleaned_text):
+        wiki_ctx = wiki_summary(cleaned_text.lower().strip())
+        logger.info("Wiki context: %s", wiki_ctx)
+
+    # Use conversation history: append user message, then read the trimmed view
+    append_history(channel_id, {"role": "user", "content": cleaned_text})
+    hist = get_history(channel_id)
+
+    # MAX_HISTORY bounds the message count; also bound the prompt by tokens,
+    # since OpenAI latency and billing scale with every byte of history
+    total_tokens = sum(m.get("_tok") or _token_len(m["content"]) for m in hist)
+    while len(hist) > 1 and total_tokens > HISTORY_TOKEN_BUDGET:
+        dropped = hist.pop(0)
+        total_tokens -= dropped.get("_tok") or _token_len(dropped["content"])
+
+    # Build system prompt: static prefix plus server time and wiki context
+    now = datetime.now()
+    system_prompt = f"{SYS_PROMPT_PREFIX}\nCurrent date and time (server): {now.strftime('%Y-%m-%d %H:%M:%S')}"
+    if wiki_ctx:
+        system_prompt += f"\nContext from Wikipedia (do not hallucinate beyond this):\n{wiki_ctx}"
+
+    # Build messages list: system + history (convert roles to OpenAI format)
+    messages = [{"role": "system", "content": system_prompt}]
+    # include history (user/assistant)
+    for item in hist:
+        messages.append({"role": item["role"], "content": item["content"]})
+
+    # Post the placeholder first so the stream has a message to edit
+    try:
+        msg_ts = client.chat_postMessage(channel=channel_id, text="…")["ts"]
+    except SlackApiError as e:
+        logger.exception("Slack API error sending message: %s", e)
+        return
+
+    # Call OpenAI with history so model has context, streaming tokens into
+    # periodic edits of the placeholder
+    try:
+        stream = openai.ChatCompletion.create(
+            model="gpt-3.5-turbo",
+            messages=messages,
+            max_tokens=400,
+            stream=True,
+        )
+        parts = []
+        last_update = time.monotonic()
+        for chunk in stream:
+            delta = chunk.choices[0].delta.get("content")
+            if not delta:
+                continue
+            parts.append(delta)
+            tick = time.monotonic()
+            if tick - last_update >= STREAM_UPDATE_INTERVAL:
+                client.chat_update(channel=channel_id, ts=msg_ts, text="".join(parts))
+                last_update = tick
+        assistant_text = "".join(parts).strip()
+        # append assistant reply to conversation history
+        append_history(channel_id, {"role": "assistant", "content": assistant_text})
+        # refresh timestamp
+        session_timestamps[channel_id] = time.time()
+        if q_vec is not None and assistant_text:
+            semantic_cache.store(q_vec, assistant_text)
+    except Exception:
+        logger.exception("OpenAI error")
+        assistant_text = "Sorry, I had an internal error while trying to answer."
+
+    # Final edit with the complete (or error) text
+    try:
+        client.chat_update(channel=channel_id, ts=msg_ts, text=assistant_text)
+        logger.info("Replied to channel %s", channel_id)
+    except SlackApiError as e:
+        logger.exception("Slack API error sending message: %s", e)
+
 @app.route("/", methods=["GET"])
 def health():
     return "OK - Slack GPT Bot is running", 200
@@ -142,40 +499,45 @@ def slack_events():
     headers = request.headers
 
     # Verify Slack signature
-    try:
-        if not signature_verifier.is_valid_request(raw_body, headers):
-            logger.warning("Slack signature verification failed.")
-            return make_response("Invalid signature", 400)
-    except Exception as e:
-        logger.exception("Exception during signature verification.")
-        return make_response("Verification error", 400)
+    if not verify_slack_signature(raw_body, headers):
+        logger.warning("Slack signature verification failed.")
+        return make_response("Invalid signature", 400)
 
-    payload = request.json or {}
-    logger.info("Full payload: %s", payload)
+    # Decode the body we already have in hand, once, with orjson — avoids
+    # request.json re-reading and parsing through stdlib json
+    try:
+        payload = orjson.loads(raw_body) if raw_body else {}
+    except orjson.JSONDecodeError:
+        payload = {}
+    # DEBUG so the repr of a large nested payload isn't built per request
+    logger.debug("Full payload: %s", payload)
 
     # URL verification
     if payload.get("type") == "url_verification":
-        return jsonify({"challenge": payload.get("challenge")})
+        return app.response_class(
+            orjson.dumps({"challenge": payload.get("challenge")}),
+            mimetype="application/json",
+        )
+
+    # Slack resends events it thinks timed out; a retry means the original
+    # delivery already reached us, so ACK without reprocessing
+    retry_num = headers.get("X-Slack-Retry-Num")
+    if retry_num and retry_num != "0":
+        logger.info("Slack retry #%s (%s) - ACKing without reprocessing",
+                    retry_num, headers.get("X-Slack-Retry-Reason"))
+        return make_response("", 200)
 
     # Dedupe by event_id (protect against retries)
     event_id = payload.get("event_id")
-    if event_id:
-        if event_id in processed_event_ids:
-            logger.info("Duplicate event_id %s - skipping", event_id)
-            return make_response("", 200)
-        processed_event_ids.add(event_id)
-        if len(processed_event_ids) > MAX_SEEN:
-            while len(processed_event_ids) > MAX_SEEN // 2:
-                processed_event_ids.pop()
-
-    # prune old sessions at start
-    prune_inactive_sessions()
+    if event_id and seen_event(event_id):
+        logger.info("Duplicate event_id %s - skipping", event_id)
+        return make_response("", 200)
 
     event = payload.get("event", {})
     if not event:
         return make_response("", 200)
 
-    logger.info("Event received: %s", event)
+    logger.debug("Event received: %s", event)
 
     # Ignore bot messages including our own and message edits
     if event.get("bot_id") or event.get("subtype") in ["bot_message", "message_changed"]:
@@ -201,80 +563,23 @@ def slack_events():
     if not cleaned_text:
         return make_response("", 200)
 
-    # Update session timestamp
-    session_timestamps[channel_id] = datetime.now().timestamp()
+    # Expire a session idle past the TTL before refreshing its timestamp —
+    # the lazy check in get_history runs after this refresh and so only ever
+    # sees a fresh time for the channel being handled
+    now_ts = time.time()
+    prev_ts = session_timestamps.get(channel_id)
+    if prev_ts is not None and now_ts - prev_ts > SESSION_TTL_SECONDS:
+        conversations.pop(channel_id, None)
+    session_timestamps[channel_id] = now_ts
 
-    # Local handling for date/time questions
-    lc = cleaned_text.lower()
-    if ("date" in lc and ("today" in lc or "current" in lc)) or (lc.strip() in ["what is today's date", "what's today's date"]):
-        response_text = f"Today's date is {datetime.now().strftime('%B %d, %Y')}."
-    elif ("time" in lc and ("now" in lc or "current" in lc)):
-        response_text = f"The current time is {datetime.now().strftime('%I:%M %p')}."
-    else:
-        # 1) custom Q&A
-        match = get_close_matches(cleaned_text.lower(), custom_qa.keys(), n=1, cutoff=0.65)
-        if match:
-            response_text = custom_qa[match[0]]
-        else:
-            # 2) Optional wiki lookup
-            wiki_ctx = None
-            if WIKI_LOOKUP_ENABLED and looks_like_search_query(cleaned_text):
-                wiki_ctx = wiki_summary(cleaned_text)
-                logger.info("Wiki context: %s", wiki_ctx)
-
-            # 3) Use conversation history: append user message to history
-            hist = conversations.get(channel_id, [])
-            # append user role
-            hist.append({"role": "user", "content": cleaned_text})
-            # trim to last MAX_HISTORY messages
-            hist = hist[-MAX_HISTORY:]
-            conversations[channel_id] = hist
-
-            # Build system prompt including wiki context and server time
-            system_prompt_lines = [
-                "You are a helpful assistant. Always be accurate and prefer saying 'I don't know' if you are not sure.",
-                f"Current date and time (server): {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
-                "If you use external facts supplied in the context, cite the source when possible."
-            ]
-            if wiki_ctx:
-                system_prompt_lines.append("Context from Wikipedia (do not hallucinate beyond this):")
-                system_prompt_lines.append(wiki_ctx)
-
-            system_prompt = "\n".join(system_prompt_lines)
-
-            # Build messages list: system + history (convert roles to OpenAI format)
-            messages = [{"role": "system", "content": system_prompt}]
-            # include history (user/assistant)
-            for item in hist:
-                messages.append({"role": item["role"], "content": item["content"]})
-
-            # Call OpenAI with history so model has context
-            try:
-                completion = openai.ChatCompletion.create(
-                    model="gpt-3.5-turbo",
-                    messages=messages,
-                    max_tokens=400,
-                )
-                assistant_text = completion.choices[0].message["content"].strip()
-                response_text = assistant_text
-                # append assistant reply to conversation history and trim
-                conversations[channel_id].append({"role": "assistant", "content": assistant_text})
-                conversations[channel_id] = conversations[channel_id][-MAX_HISTORY:]
-                # refresh timestamp
-                session_timestamps[channel_id] = datetime.now().timestamp()
-            except Exception:
-                logger.exception("OpenAI error")
-                response_text = "Sorry, I had an internal error while trying to answer."
-
-    # Send reply back to Slack
-    try:
-        client.chat_postMessage(channel=channel_id, text=response_text)
-        logger.info("Replied to channel %s", channel_id)
-    except SlackApiError as e:
-        logger.exception("Slack API error sending message: %s", e)
+    # Answer off the request thread so Slack gets its 200 immediately;
+    # retries of slow events are already caught by the event_id dedupe above.
+    executor.submit(_handle_event, channel_id, cleaned_text)
 
     return make_response("", 200)
 
 if __name__ == "__main__":
+    # Local development only. Deploy behind gunicorn (see Procfile) so
+    # concurrent Slack events overlap instead of serializing on the dev server.
     port = int(os.environ.get("PORT", 3000))
     app.run(host="0.0.0.0", port=port)
@@ -0,0 +1,129 @@
+"""In-memory semantic answer cache.
+
+Near-duplicate questions ("what's the leave policy" / "tell me the leave
+policy") would otherwise each pay a full chat-completion round trip. We embed
+the query once, compare it against cached (embedding, answer) pairs by cosine
+similarity, and reuse the cached answer above a threshold.
+
+Per-process, dev-friendly state — same caveat as the in-memory stores in
+app.py: replace with a shared store for multi-worker production deployments.
+"""
+
+import logging
+import threading
+import time
+
+import numpy as np
+import openai
+
+try:
+    import faiss
+except ImportError:  # linear scan still works, just O(N) per lookup
+    faiss = None
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+SIMILARITY_THRESHOLD = 0.92
+MAX_ENTRIES = 10_000
+TTL_SECONDS = 60 * 60
+# Below this many entries a brute-force dot product beats HNSW graph overhead.
+HNSW_MIN_ENTRIES = 512
+# Candidates kept from the int8 coarse scan for exact fp32 rescoring.
+RESCORE_TOP = 10
+
+_lock = threading.Lock()
+_matrix = np.empty((0, 0), dtype=np.float32)  # (N, dim); rows L2-normalized
+_matrix_i8 = np.empty((0, 0), dtype=np.int8)  # quantized copy for coarse scans
+_answers: list[str] = []
+_timestamps: list[float] = []
+_index = None          # faiss.IndexHNSWFlat over _matrix, built lazily
+_indexed_rows = 0      # rows of _matrix already added to _index
+
+def embed(text: str) -> np.ndarray | None:
+    """Return the L2-normalized embedding for text, or None on API failure."""
+    try:
+        resp = openai.Embedding.create(model=EMBEDDING_MODEL, input=text)
+        vec = np.asarray(resp["data"][0]["embedding"], dtype=np.float32)
+        return vec / np.linalg.norm(vec)
+    except Exception:
+        logger.exception("Embedding call failed; skipping semantic cache")
+        return None
+
+def lookup(query_vec: np.ndarray) -> str | None:
+    """Return a cached answer whose query is similar enough, else None."""
+    with _lock:
+        _expire_locked()
+        if not _answers:
+            return None
+        best, score = _search_locked(query_vec)
+        if score >= SIMILARITY_THRESHOLD:
+            return _answers[best]
+    return None
+
+def _search_locked(query_vec: np.ndarray) -> tuple[int, float]:
+    """Return (row, cosine score) of the nearest cached entry."""
+    if faiss is not None and len(_answers) >= HNSW_MIN_ENTRIES:
+        index = _ensure_index_locked()
+        scores, ids = index.search(query_vec.reshape(1, -1), 1)
+        return int(ids[0][0]), float(scores[0][0])
+    if len(_answers) > RESCORE_TOP:
+        # Coarse int8 scan (quarter of the bytes of fp32), then rescore the
+        # top candidates exactly to recover any recall the rounding lost.
+        coarse = _matrix_i8.astype(np.int16) @ _quantize(query_vec).astype(np.int16)
+        candidates = np.argpartition(coarse, -RESCORE_TOP)[-RESCORE_TOP:]
+        scores = _matrix[candidates] @ query_vec
+        best = int(candidates[np.argmax(scores)])
+        return best, float(np.max(scores))
+    scores = _matrix @ query_vec
+    best = int(np.argmax(scores))
+    return best, float(scores[best])
+
+def _quantize(vec: np.ndarray) -> np.ndarray:
+    """Map a normalized fp32 vector onto int8 (components are within [-1, 1])."""
+    return np.clip(np.round(vec * 127.0), -127, 127).astype(np.int8)
+
+def _ensure_index_locked():
+    """Build or incrementally extend the HNSW index to cover _matrix."""
+    global _index, _indexed_rows
+    if _index is None:
+        _index = faiss.IndexHNSWFlat(_matrix.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+        _index.hnsw.efSearch = 64
+        _indexed_rows = 0
+    if _indexed_rows < _matrix.shape[0]:
+        _index.add(np.ascontiguousarray(_matrix[_indexed_rows:]))
+        _indexed_rows = _matrix.shape[0]
+    return _index
+
+def store(query_vec: np.ndarray, answer: str) -> None:
+    """Remember (query embedding, answer), evicting the oldest beyond capacity."""
+    global _matrix, _matrix_i8
+    with _lock:
+        if _matrix.size == 0:
+            _matrix = query_vec.reshape(1, -1)
+            _matrix_i8 = _quantize(query_vec).reshape(1, -1)
+        else:
+            _matrix = np.vstack([_matrix, query_vec])
+            _matrix_i8 = np.vstack([_matrix_i8, _quantize(query_vec)])
+        _answers.append(answer)
+        _timestamps.append(time.time())
+        if len(_answers) > MAX_ENTRIES:
+            _drop_oldest_locked(len(_answers) - MAX_ENTRIES)
+
+def _expire_locked() -> None:
+    """Drop entries older than TTL_SECONDS (timestamps are append-ordered)."""
+    cutoff = time.time() - TTL_SECONDS
+    drop = 0
+    while drop < len(_timestamps) and _timestamps[drop] < cutoff:
+        drop += 1
+    if drop:
+        _drop_oldest_locked(drop)
+
+def _drop_oldest_locked(n: int) -> None:
+    global _matrix, _matrix_i8, _index
+    _matrix = _matrix[n:]
+    _matrix_i8 = _matrix_i8[n:]
+    del _answers[:n]
+    del _timestamps[:n]
+    # HNSW doesn't support removal; rebuild lazily on the next large search
+    _index = None